@@ -1,7 +1,13 @@
+import gc
+import os
+import sys
+import subprocess
+import warnings
+import weakref
 import numpy as np
 import torch
 import unittest
-from tinygrad.tensor import Tensor
+from tinygrad.tensor import Tensor, Function, GPU
 from extra.gradcheck import numerical_jacobian, jacobian, gradcheck
 
 x_init = np.random.randn(1,3).astype(np.float32)
@@ -33,6 +39,88 @@ class TestTinygrad(unittest.TestCase):
     for x,y in zip(test_tinygrad(), test_pytorch()):
       np.testing.assert_allclose(x, y, atol=1e-5)
 
+  def test_backward_deep_graph(self):
+    x = Tensor(x_init)
+    out = x
+    for _ in range(5000):
+      out = out.add(x)
+    out.sum().backward()
+    np.testing.assert_allclose(x.grad.data, np.full(x_init.shape, 5001.))
+
+  def test_accumulate_no_apply(self):
+    # x gets three grad contributions, they're summed with numpy and not through Add
+    x = Tensor(x_init)
+    out = x.add(x).mul(x).sum()
+    calls, apply = [], Function.apply
+    Function.apply = lambda *x, **kwargs: calls.append(x[0]) or apply(*x, **kwargs)
+    try:
+      out.backward()
+    finally:
+      Function.apply = apply
+    self.assertEqual(calls, [])
+    np.testing.assert_allclose(x.grad.data, 4*x_init, rtol=1e-6)
+
+  def test_div_negative(self):
+    # div's exponent is a constant and gets no grad, so there's no log of the negative y
+    x, y = Tensor(x_init), Tensor(-np.abs(m_init)-1)
+    with warnings.catch_warnings():
+      warnings.simplefilter("error")
+      x.div(y).sum().backward()
+    np.testing.assert_allclose(y.grad.data, -x_init/y.data**2, rtol=1e-5)
+
+  def test_graph_freed(self):
+    # backward leaves no reference cycles, dropping the loss frees the graph without the gc
+    gc.disable()
+    try:
+      h = Tensor(x_init).dot(Tensor(W_init)).relu()
+      ref = weakref.ref(h.data)
+      out = h.sum()
+      out.backward()
+      del h, out
+      self.assertIsNone(ref())
+    finally:
+      gc.enable()
+
+  def test_no_grad(self):
+    x = Tensor(x_init)
+    W = Tensor(W_init)
+    with Tensor.no_grad():
+      out = x.dot(W).relu().logsoftmax()
+    self.assertIsNone(out._ctx)
+    np.testing.assert_allclose(out.data, x.dot(W).relu().logsoftmax().data)
+    self.assertIsNotNone(x.dot(W)._ctx)
+    with Tensor.no_grad():
+      self.assertRaises(Exception, x.dot(W).sum().backward)
+
+  def test_no_grad_env(self):
+    # NO_GRAD is read at import, it needs a fresh interpreter
+    code = "from tinygrad.tensor import Tensor\nout = Tensor([[1., -2.]]).relu().sum()\nassert out._ctx is None\nout.backward()"
+    ret = subprocess.run([sys.executable, "-c", code], env=dict(os.environ, NO_GRAD="1"),
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), capture_output=True)
+    self.assertIn(b"backward with grads disabled", ret.stderr)
+
+  @unittest.skipUnless(GPU, "Requires GPU")
+  def test_cuda_snapshot(self):
+    # writing the host array right after the upload must not change the device copy
+    x = np.ones((256, 256), dtype=np.float32)
+    t = Tensor(x).cuda()
+    x += 1
+    np.testing.assert_allclose(t.cpu().data, 1.)
+    # a non contiguous array is copied first and uploaded async
+    y = np.arange(6, dtype=np.float32).reshape(2, 3).T
+    np.testing.assert_allclose(Tensor(y).cuda().cpu().data, y)
+
+  def test_int_cast(self):
+    x = Tensor(np.arange(6).reshape(2, 3))
+    self.assertEqual(x.data.dtype, np.float32)
+    self.assertEqual(Tensor(np.zeros(3)).data.dtype, np.float64)
+
+  def test_grad_not_tracked(self):
+    x = Tensor(x_init)
+    out = x.add(x).mul(x).sum()
+    out.backward()
+    self.assertIsNone(x.grad._ctx)
+
   def test_jacobian(self):
     W = np.random.RandomState(1337).random((10, 5))
     x = np.random.RandomState(7331).random((1, 10)) - 0.5
@@ -1,5 +1,3 @@
-import sys
-import warnings
 import numpy as np
 from .tensor import Function, register
 '''
@@ -50,30 +48,18 @@ class Mul(Function):
     return unbroadcast(y*grad_output, x.shape), unbroadcast(x*grad_output, y.shape)
 register('mul', Mul)
 
-class Div(Function):
-  @staticmethod
-  def forward(ctx, x, y):
-    ctx.save_for_backward(x, y)
-    return x / y
-
-  @staticmethod
-  def backward(ctx, grad_output):
-    x,y = ctx.saved_tensors
-    return unbroadcast(grad_output / y, x.shape), unbroadcast(-x * grad_output / y**2, y.shape)
-# TODO: registering this breaks the default div on the GPU
-#register('div', Div)
-
 class Pow(Function):
   @staticmethod
-  def forward(ctx, x, y):
+  def forward(ctx, x, y, const_y=False):
     ctx.save_for_backward(x, y)
     return x ** y
 
   @staticmethod
   def backward(ctx, grad_output):
     x,y = ctx.saved_tensors
+    # a constant exponent (sqrt, div) gets no grad, it would be a full size x**y * log(x) summed away
     return unbroadcast(y * (x**(y-1.0)) * grad_output, x.shape), \
-           unbroadcast((x**y) * np.log(x) * grad_output, y.shape)
+           None if ctx.const_y else unbroadcast((x**y) * np.log(x) * grad_output, y.shape)
 register('pow', Pow)
 
 class Sum(Function):
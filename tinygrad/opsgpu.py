@@ -1,16 +1,15 @@
 import numpy as np
-from .tensor import Function, register, Tensor
+from .tensor import Function, register, Tensor, cl_build_cached
 import pyopencl as cl
-import functools
 
 def buffer_new(ctx, shape):
-  res_g = cl.Buffer(ctx.cl_ctx, cl.mem_flags.WRITE_ONLY, 4*np.prod(shape))
+  res_g = cl.Buffer(ctx.cl_ctx, cl.mem_flags.READ_WRITE, 4*np.prod(shape))
   res_g.shape = tuple(shape)
   res_g.dtype = np.float32
   return res_g
 
 def buffer_np(ctx, np_array):
-  res_g = cl.Buffer(ctx.cl_ctx, cl.mem_flags.WRITE_ONLY | cl.mem_flags.COPY_HOST_PTR, hostbuf=np_array)
+  res_g = cl.Buffer(ctx.cl_ctx, cl.mem_flags.READ_WRITE | cl.mem_flags.COPY_HOST_PTR, hostbuf=np_array)
   res_g.shape = np_array.shape
   res_g.dtype = np_array.dtype
   return res_g
@@ -21,17 +20,17 @@ def buffer_zeros(ctx, shape):
 def buffer_like(ctx, x):
   return buffer_new(ctx, x.shape)
 
-@functools.lru_cache()
-def clbuild(cl_ctx, prg):
-  return cl.Program(cl_ctx, prg).build()
-
 def uint2(x, y):
   return np.array((x,y), dtype=cl.cltypes.uint2)
 
 i32 = np.int32
 
-def cl_subsample_krnl_build(cl_ctx, iter_op, result_op, decls=''):
-  prg = """
+def subsample_op(ctx, input, kernel_size, stride, iter_op, result_op, decls=''):
+  py, px = stride
+  N, C, Yin, Xin = input.shape
+  Yout, Xout = (Yin-kernel_size[0])//py+1, (Xin-kernel_size[1])//px+1
+  ret = buffer_zeros(ctx, (N, C, Yout, Xout))
+  prg = cl_build_cached("""
   __kernel void subsample(__global float *output, __global const float *input, uint2 osize, uint2 isize,
                           uint2 ksz, uint2 stride) {
     int3 gid = (int3)(get_global_id(2), get_global_id(1), get_global_id(0));
@@ -46,23 +45,18 @@ def cl_subsample_krnl_build(cl_ctx, iter_op, result_op, decls=''):
       }
     }
     output[oid] = """+result_op+""";
-  }"""
-  return clbuild(cl_ctx, prg)
-
-def subsample_op(ctx, input, kernel_size, stride, iter_op, result_op, decls=''):
-  py, px = stride
-  N, C, Yin, Xin = input.shape
-  Yout, Xout = (Yin-kernel_size[0])//py+1, (Xin-kernel_size[1])//px+1
-  ret = buffer_zeros(ctx, (N, C, Yout, Xout))
-  prg = cl_subsample_krnl_build(ctx.cl_ctx, iter_op, result_op, decls=decls)
+  }""")
   prg.subsample(ctx.cl_queue, (N*C, Yout, Xout), None,
                 ret, input, uint2(Xout, Yout), uint2(Xin, Yin),
                 uint2(*kernel_size[::-1]), uint2(px, py))
   ctx.data = np.empty((N, C, Yout, Xout)) # set shape expectation on tensor instance
   return ret
 
-def cl_supsample_krnl_build(cl_ctx, result_op, decls=''):
-  prg = """
+def supersample_op(ctx, input, out_shape, kernel_size, result_op, decls='', input2=None):
+  (N, C, Yin, Xin), (Yout, Xout) = input.shape, out_shape[2:]
+  py,px = kernel_size
+  ret = buffer_zeros(ctx, out_shape)
+  prg = cl_build_cached("""
   __kernel void supsample(__global float *output, __global const float *input, __global const void *input2,
                           uint2 osize, uint2 isize, uint2 ksz) {
     int3 gid = (int3)(get_global_id(2), get_global_id(1), get_global_id(0));
@@ -72,14 +66,7 @@ def cl_supsample_krnl_build(cl_ctx, result_op, decls=''):
     if (gid.x/ksz.x < isize.x && gid.y/ksz.y < isize.y) {
       output[oid] = """+result_op+""";
     }
-  }"""
-  return clbuild(cl_ctx, prg)
-
-def supersample_op(ctx, input, out_shape, kernel_size, result_op, decls='', input2=None):
-  (N, C, Yin, Xin), (Yout, Xout) = input.shape, out_shape[2:]
-  py,px = kernel_size
-  ret = buffer_zeros(ctx, out_shape)
-  prg = cl_supsample_krnl_build(ctx.cl_ctx, result_op, decls=decls)
+  }""")
   prg.supsample(ctx.cl_queue, (N*C, Yout, Xout), None,
                 ret, input, input2, uint2(Xout, Yout), uint2(Xin, Yin), uint2(px, py))
   ctx.data = np.empty((N, C, Yout, Xout)) # set shape expectation on tensor instance
@@ -95,7 +82,7 @@ def binary_op(ctx, code, x, y):
   shape_ret = np.maximum(shape_x, shape_y)
   ret = buffer_zeros(ctx, shape_ret)
 
-  prg = clbuild(ctx.cl_ctx, """
+  prg = cl_build_cached("""
   __kernel void binop(__global const float *a_g, __global const float *b_g, __global float *res_g, int n_dims, int prod,
           __global const int *shape_x, __global const int *shape_y, __global const int *shape_ret) {
     // invariant: prod should contain the product of all dimensions (of the returned tensor) that we haven't handled yet
@@ -120,7 +107,7 @@ def binary_op(ctx, code, x, y):
 
 def unary_op(ctx, code, x):
   ret = buffer_like(ctx, x)
-  prg = clbuild(ctx.cl_ctx, """
+  prg = cl_build_cached("""
   __kernel void unop(__global const float *a_g, __global float *res_g) {
     int gid = get_global_id(0);
     float a = a_g[gid];
@@ -141,7 +128,7 @@ def reduce_op(ctx, code, code2, inp, axis=None):
     ret.shape = (1,)
 
   # TODO: this is insanely slow
-  prg = clbuild(ctx.cl_ctx, """
+  prg = cl_build_cached("""
   __kernel void reduce(__global const float *a_g, int sz, __global float *res_g, int prod, int n_dims,
                        __global const int *shape_x, __global const int *shape_ret) {
     int gid = get_global_id(0);
@@ -220,7 +207,7 @@ register('mul', Mul, gpu=True)
 
 class Pow(Function):
   @staticmethod
-  def forward(ctx, x, y):
+  def forward(ctx, x, y, const_y=False):
     ctx.save_for_backward(x, y)
     return binary_op(ctx, 'pow(a,b)', x, y)
 
@@ -229,6 +216,8 @@ class Pow(Function):
     x,y = ctx.saved_tensors
     grad_x = binary_op(ctx, 'a*b', grad_output,
                       binary_op(ctx, 'b * (pow((float)a, (float)(b-1.0)))', x, y))
+    if ctx.const_y:
+      return unbroadcast(ctx, grad_x, x.shape), None
     grad_y = binary_op(ctx, 'a*b', grad_output,
                       binary_op(ctx, 'pow(a, (float)b) * log(a);', x, y))
     return unbroadcast(ctx, grad_x, x.shape), unbroadcast(ctx, grad_y, y.shape),
@@ -245,7 +234,7 @@ class Sum(Function):
     input, = ctx.saved_tensors
     ret = buffer_like(ctx, input)
 
-    prg = clbuild(ctx.cl_ctx, """
+    prg = cl_build_cached("""
     __kernel void fill(__global const float *a_g, __global float *res_g) {
       int gid = get_global_id(0);
       res_g[gid] = a_g[0];
@@ -262,7 +251,7 @@ class Dot(Function):
     isize, msize, osize = i32(input.shape[0]), i32(input.shape[1]), i32(weight.shape[1])
     ret = buffer_new(ctx, (isize, osize))
 
-    prg = clbuild(ctx.cl_ctx, """
+    prg = cl_build_cached("""
     __kernel void matmul(
         __global const float *input,
         __global const float *weight,
@@ -319,7 +308,7 @@ class Pad2D(Function):
     oy,ox = iy+padding[2]+padding[3], ix+padding[0]+padding[1]
     ret = buffer_zeros(ctx, (bs, cin, oy, ox))
 
-    prg = clbuild(ctx.cl_ctx, """
+    prg = cl_build_cached("""
     __kernel void pad2d(__global const float *input, __global float *output,
                         int ipx, int ipy, int py, int px, int oy, int ox, int iy, int ix) {
       int BC = get_global_id(0);
@@ -470,7 +459,7 @@ class Conv2D(Function):
     # output buffer
     ret = buffer_new(ctx, (bs, cout, oy, ox))
 
-    prg = clbuild(ctx.cl_ctx, """
+    prg = cl_build_cached("""
     __kernel void conv(__global const float *input, __global const float *weight, __global float *output,
       int H, int W, int groups, int rcout, int cin, int oy, int ox, int iy, int ix, int ys, int xs) {
 
@@ -520,7 +509,7 @@ class Conv2D(Function):
     dx = buffer_zeros(ctx, (bs, cin_, iy, ix))
     dw = buffer_new(ctx, (cout, cin, H, W))
 
-    prg = clbuild(ctx.cl_ctx, """
+    prg = cl_build_cached("""
     __kernel void convw(__global const float *tensx, __global const float *ggg, __global float *dw,
       int H, int W, int groups, int rcout, int cin, int oy, int ox, int iy, int ix, int ys, int xs, int bs) {
 
@@ -1,6 +1,9 @@
 # inspired by https://github.com/karpathy/micrograd/blob/master/micrograd/engine.py
 from inspect import signature
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
 import numpy as np
+import math
 import os
 try:
   import pyopencl as cl # pyopencl 科学计算库，gpu加速
@@ -8,6 +11,7 @@ try:
 except ImportError:
   # no GPU support
   GPU = False
+_CL_BUFFER = cl._cl.Buffer if GPU else None
   
 # **** Python中带下划线的变量和方法总结 —— https://blog.csdn.net/tcx1992/article/details/80105645 ****
 # **** 1、单前导下划线 _var ：非强制约定该变量或方法仅内部使用（私有）。****
@@ -19,14 +23,14 @@ except ImportError:
 # **** profiler, 10 lines too long ****
 DEBUG = os.getenv("DEBUG", None) is not None
 if DEBUG:
-  import collections, atexit, time
+  import collections, atexit, time, operator
   # defaultdict()中参数为字典value的类型
   debug_counts = collections.defaultdict(int)
   debug_times = collections.defaultdict(float)
   def print_debug_exit():
     # sorted方法 第一个参数：可迭代对象 第二个参数：排序的属性 第三个参数：排序规则，reverse是否降序
     # 这里取倒序
-    for name, _ in sorted(debug_times.items(), key=lambda x: -x[1]):
+    for name, _ in sorted(debug_times.items(), key=operator.itemgetter(1), reverse=True):
       print("%20s : %3d  %10.2f ms" % (name, debug_counts[name], debug_times[name]))
   # python atexit 模块定义了一个 register 函数，用于在 python 解释器中注册一个退出函数，这个函数在解释器正常终止时自动执行,一般用来做一些资源清理的操作。 
   # atexit 按注册的相反顺序执行这些函数; 例如注册A、B、C，在解释器终止时按顺序C，B，A运行。
@@ -34,18 +38,19 @@ if DEBUG:
   # print_debug_exit 即为注册的退出函数
   atexit.register(print_debug_exit)
 
+# only used when DEBUG is set, the call sites take the shared no-op below otherwise
 class ProfileOp:
   def __init__(self, name, x, backward=False):
     self.name = ("back_" if backward else "")+name
     self.x = x
   def __enter__(self):
-    if DEBUG: self.st = time.time()
+    self.st = time.time()
   def __exit__(self, *junk):
-    if DEBUG:
-      et = (time.time()-self.st)*1000.
-      debug_counts[self.name] += 1
-      debug_times[self.name] += et
-      print("%20s : %7.2f ms  %s" % (self.name, et, [y.shape for y in self.x]))
+    et = (time.time()-self.st)*1000.
+    debug_counts[self.name] += 1
+    debug_times[self.name] += et
+    print("%20s : %7.2f ms  %s" % (self.name, et, [y.shape for y in self.x]))
+NO_PROFILE = nullcontext()
 
 cl_ctx, cl_queue = None, None
 # gpu初始化
@@ -58,10 +63,22 @@ def require_init_gpu():
     except (cl._cl.RuntimeError, cl._cl.LogicError, TypeError):
       cl_ctx = cl.create_some_context(interactive=False)
     cl_queue = cl.CommandQueue(cl_ctx)
+    # every Function sees the context through the base class
+    Function.cl_ctx, Function.cl_queue = cl_ctx, cl_queue
+
+# every kernel is compiled once per source, there's only ever one cl_ctx
+@lru_cache(maxsize=None)
+def cl_build_cached(src):
+  return cl.Program(cl_ctx, src).build()
+
+# **** graph construction, off under Tensor.no_grad() or with NO_GRAD set ****
+_GRAD_ENABLED = os.getenv("NO_GRAD", None) is None
 
 # **** start with two base classes ****
 
 class Tensor:
+  # no per instance __dict__, the class level defaults below aren't slots
+  __slots__ = ('data', 'grad', 'gpu', '_ctx')
   did_float_warning = False
   default_gpu = False
 
@@ -69,19 +86,22 @@ class Tensor:
   def __init__(self, data, gpu=None):
     if gpu is None:
       gpu = Tensor.default_gpu
-    if isinstance(data, list):
-      data = np.array(data, dtype=np.float32)
-    elif GPU and isinstance(data, cl._cl.Buffer):
-      self.gpu = True
-    elif not isinstance(data, np.ndarray):
-      raise TypeError("Error constructing tensor with %r" % data)
-
+    if type(data) is list:
+      data = np.asarray(data, dtype=np.float32)
+    # ndarray first, it's every CPU op result. the Buffer type is looked up once at import
     if isinstance(data, np.ndarray):
-      if data.dtype != np.float32 and not Tensor.did_float_warning:
+      if data.dtype != np.float32 and data.dtype != np.float64:
+        # ints, bools and halfs are cast once here instead of widening every op after
+        data = data.astype(np.float32)
+      elif DEBUG and data.dtype == np.float64 and not Tensor.did_float_warning:
         # warning? float64 is actually needed for numerical jacobian
         print("warning, %r isn't float32" % (data.shape,))
         Tensor.did_float_warning = True
       self.gpu = False
+    elif type(data) is _CL_BUFFER:
+      self.gpu = True
+    else:
+      raise TypeError("Error constructing tensor with %r" % data)
 
     self.data = data
     # grad是Tensor
@@ -114,17 +134,23 @@ class Tensor:
   def ones(*shape):
     return Tensor(np.ones(shape, dtype=np.float32))
 
+  # generated as float32 directly, np.random.randn only makes float64
+  # NOTE: np.random.seed doesn't affect it, set Tensor.rng = np.random.default_rng(seed)
+  rng = np.random.default_rng()
+
   @staticmethod
   def randn(*shape):
-    return Tensor(np.random.randn(*shape).astype(np.float32))
+    return Tensor(Tensor.rng.standard_normal(shape, dtype=np.float32))
 
   @staticmethod
   def eye(dim):
-    return Tensor(np.eye(dim).astype(np.float32))
+    return Tensor(np.eye(dim, dtype=np.float32))
 
   # 反向传播
   def backward(self, allow_fill=True):
     if self._ctx is None:
+      if not _GRAD_ENABLED:
+        raise Exception("backward with grads disabled, no graph was recorded")
       return
 
     if self.grad is None and allow_fill:
@@ -134,33 +160,41 @@ class Tensor:
       self.grad = Tensor(np.ones(self.data.shape, dtype=self.data.dtype), gpu=self.gpu)
     
     # nodes是一个Tensor列表，node为Tensor
-    visited, nodes = set(), []
-    # 递归访问
-    def deepwalk(node):
-      visited.add(node)
-      if node._ctx:
-        for i in node._ctx.parents:
-          if i not in visited:
-            deepwalk(i)
-        nodes.append(node)
-    deepwalk(self)
-
-    for t0 in reversed(nodes):
-      assert (t0.grad is not None)
-      # __class__.__name__ 类名
-      # 在调试环境下进行反向传播（梯度计算）
-      with ProfileOp(t0._ctx.__class__.__name__, [t0.grad], backward=True):
-        grads = t0._ctx.backward(t0._ctx, t0.grad.data)
-      # grads放到列表中，以便下面应用zip方法
-      if len(t0._ctx.parents) == 1:
-        grads = [grads]
-      for t,g in zip(t0._ctx.parents, grads):
-        if g is None:
-          continue
-        assert g.shape == t.data.shape, \
-          "grad shape must match tensor shape in %r, %r != %r" % (self._ctx, g.shape, t.data.shape)
-        # 在backward中作了链式的乘法运算，这里将不同parents对该变量的梯度（偏导数）再求和
-        t.grad = Tensor(g) if t.grad is None else (t.grad + Tensor(g))
+    # iterative post-order walk, deep graphs don't hit the recursion limit
+    visited, nodes, stack = set(), [], [(self, False)]
+    while stack:
+      node, expanded = stack.pop()
+      if expanded: nodes.append(node)
+      elif node not in visited:
+        visited.add(node)
+        if node._ctx:
+          stack.append((node, True))
+          stack.extend((i, False) for i in reversed(node._ctx.parents) if i not in visited)
+
+    # the grad checks only run under DEBUG, they're per edge on the hot path
+    # no_grad: whatever a backward does, it never records a second order graph
+    with Tensor.no_grad():
+      for t0 in reversed(nodes):
+        # __class__.__name__ 类名
+        # 在调试环境下进行反向传播（梯度计算）
+        with ProfileOp(t0._ctx.__class__.__name__, [t0.grad], backward=True) if DEBUG else NO_PROFILE:
+          grads = t0._ctx.backward(t0._ctx, t0.grad.data)
+        # grads放到列表中，以便下面应用zip方法
+        if len(t0._ctx.parents) == 1:
+          grads = [grads]
+        for t,g in zip(t0._ctx.parents, grads):
+          if g is None:
+            continue
+          if DEBUG:
+            assert g.shape == t.data.shape, \
+              "grad shape must match tensor shape in %r, %r != %r" % (self._ctx, g.shape, t.data.shape)
+          # 在backward中作了链式的乘法运算，这里将不同parents对该变量的梯度（偏导数）再求和
+          # on the CPU a grad that's a view, not owning its data, is replaced once by a plain numpy sum
+          # and every contribution after that is added in place. the GPU add runs outside the graph
+          if t.grad is None: t.grad = Tensor(g)
+          elif t.gpu: t.grad = t.grad + Tensor(g)
+          elif t.grad.data.flags.owndata: t.grad.data += g
+          else: t.grad = Tensor(t.grad.data + g)
 
   # ***** tinygrad supports CPU and GPU *****
 
@@ -187,7 +221,11 @@ class Tensor:
     if not self.gpu:
       require_init_gpu()
       assert self.data.dtype == np.float32   # only float32 on GPU
-      data = cl.Buffer(cl_ctx, cl.mem_flags.READ_ONLY | cl.mem_flags.COPY_HOST_PTR, hostbuf=self.data.ravel())
+      hostbuf = np.ascontiguousarray(self.data)
+      data = cl.Buffer(cl_ctx, cl.mem_flags.READ_WRITE, size=hostbuf.nbytes)
+      # async only when hostbuf is a private copy, the caller may write self.data right after we return
+      # the event is kept on the buffer, it holds hostbuf until the copy is done
+      data.event = cl.enqueue_copy(cl_queue, data, hostbuf, is_blocking=np.may_share_memory(hostbuf, self.data))
       data.shape = self.shape
       data.dtype = self.data.dtype
       ret = Tensor(data)
@@ -200,6 +238,17 @@ class Tensor:
   def detach(self):
     return Tensor(self.data, self.gpu)
 
+  # ops inside don't record a graph, for inference
+  @staticmethod
+  @contextmanager
+  def no_grad():
+    global _GRAD_ENABLED
+    prev, _GRAD_ENABLED = _GRAD_ENABLED, False
+    try:
+      yield
+    finally:
+      _GRAD_ENABLED = prev
+
   # ***** put ops in these dicts *****
 
   ops = {}
@@ -208,25 +257,22 @@ class Tensor:
   # ***** non first class ops *****
   # ***** 一些稍复杂的算子 ****
 
+  # the constants are one element broadcasts, not full size arrays. the pow exponents take no grad
   def mean(self):
-    div = Tensor(np.array([1/np.prod(self.shape)], dtype=self.data.dtype), gpu=self.gpu)
-    return self.sum().mul(div)
+    return self.sum().mul(Tensor(np.array([1/math.prod(self.shape)], dtype=self.data.dtype), gpu=self.gpu))
 
   def sqrt(self):
-    root = Tensor(np.zeros(self.shape, dtype=self.data.dtype)+0.5, gpu=self.gpu)
-    return self.pow(root)
+    return self.pow(Tensor(np.full((1,)*len(self.shape), 0.5, dtype=self.data.dtype), gpu=self.gpu), const_y=True)
 
   def div(self, y):
-    root = Tensor(np.zeros(self.shape, dtype=self.data.dtype)-1, gpu=self.gpu)
-    return self.mul(y.pow(root))
+    return self.mul(y.pow(Tensor(np.full((1,)*len(y.shape), -1.0, dtype=y.data.dtype), gpu=y.gpu), const_y=True))
 
   def swish(self):
     return self.mul(self.sigmoid())
 
   def tanh(self):
-    t2 = Tensor(np.zeros(self.shape, dtype=self.data.dtype)+2, gpu=self.gpu)
-    t1 = Tensor(np.zeros(self.shape, dtype=self.data.dtype)+1, gpu=self.gpu)
-    return self.mul(t2).sigmoid().mul(t2) - t1 # 2*sigmoid(2*x)-1
+    s = self.add(self).sigmoid()
+    return s.add(s).sub(Tensor(np.ones((1,)*len(self.shape), dtype=self.data.dtype), gpu=self.gpu)) # 2*sigmoid(2*x)-1
 
 # An instantiation of the Function is the Context
 class Function:
@@ -242,35 +288,35 @@ class Function:
     op = self
     # x——tensors,tensor列表
     ctx = op(*x)
-    # use default params
-    params = signature(op.forward).parameters
-    for p in params.values():
-      if p.default is not p.empty:
-        setattr(ctx, p.name, p.default)
+    # use default params, looked up once per Function class
+    if '_defaults_cache' not in op.__dict__:
+      op._defaults_cache = {p.name: p.default for p in signature(op.forward).parameters.values() if p.default is not p.empty}
+    ctx.__dict__.update(op._defaults_cache)
     # overwrite with passed params
     for k, v in kwargs.items():
       setattr(ctx, k, v)
     # 前向运算
-    with ProfileOp(ctx.__class__.__name__, x):
+    with ProfileOp(ctx.__class__.__name__, x) if DEBUG else NO_PROFILE:
       ret = Tensor(op.forward(ctx, *[t.data for t in x], **kwargs))
-    ret._ctx = ctx
+    # without grad the ctx is dropped after forward, nothing is recorded
+    ret._ctx = ctx if _GRAD_ENABLED else None
     return ret
 
 # 注册函数,fxn函数
 def register(name, fxn, gpu=False):
-  if gpu:
-    # opsgpu和ops字典
-    Tensor.opsgpu[name] = fxn
-  else:
-    Tensor.ops[name] = fxn
+  # opsgpu和ops字典
+  (Tensor.opsgpu if gpu else Tensor.ops)[name] = fxn
+  # bind the implementations now, the gpu ones are registered after the cpu ones
+  cpu_fxn, gpu_fxn = Tensor.ops.get(name), Tensor.opsgpu.get(name)
   def dispatch(*x, **kwargs):
-    f = (Tensor.opsgpu if x[0].gpu else Tensor.ops)[name]
-    f.cl_ctx, f.cl_queue = cl_ctx, cl_queue
+    f = gpu_fxn if x[0].gpu else cpu_fxn
     return f.apply(f, *x, **kwargs)
   setattr(Tensor, name, dispatch)
   if name in ['add', 'sub', 'mul', 'div']:
-    setattr(Tensor, "__%s__" % name, dispatch)
-    setattr(Tensor, "__i%s__" % name, lambda self,x: self.assign(dispatch(self,x)))
+    # the operators are the most called ops, give them a fixed two argument version
+    binop = lambda self, x: gpu_fxn.apply(gpu_fxn, self, x) if self.gpu else cpu_fxn.apply(cpu_fxn, self, x)
+    setattr(Tensor, "__%s__" % name, binop)
+    setattr(Tensor, "__i%s__" % name, lambda self,x: self.assign(binop(self,x)))
 
 
 # this registers all the operations